@@ -3,55 +3,204 @@ Dynamic DNS Updater for domain.tenten.vn
 Automates A record updates using Playwright browser automation
 """
 import asyncio
+import atexit
 import json
 import logging
-import random
+import logging.handlers
+import os
+import queue
+import re
+import statistics
 import sys
-from typing import Optional, Dict, Any, List
+import tempfile
+import time
+from urllib.parse import urlparse
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable, Deque
+from collections import defaultdict, deque
 import argparse
 from playwright.async_api import async_playwright, Page, BrowserContext, ViewportSize
-import requests
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+import aiohttp
 
 class TentenDDNSUpdater:
-    # Class constants for selectors
-    USERNAME_SELECTORS = [
+    # Class constants for selectors, pre-joined so each lookup is a single query.
+    # Playwright-only :has-text selectors are kept apart and tried only as a fallback.
+    USERNAME_SELECTOR = ", ".join([
         'input[name="username"]',
         'input[type="email"]',
         '#username',
         'input[placeholder*="username" i]',
         'input[placeholder*="email" i]'
-    ]
+    ])
 
-    PASSWORD_SELECTORS = [
+    PASSWORD_SELECTOR = ", ".join([
         'input[name="password"]',
         'input[type="password"]',
         '#password'
-    ]
+    ])
 
-    SUBMIT_SELECTORS = [
+    SUBMIT_SELECTOR = ", ".join([
         'button[type="submit"]',
         'input[type="submit"]',
         'input[name="submit"]',
-        'button:has-text("Login")',
-        'button:has-text("Đăng nhập")',
         '.btn-login'
+    ])
+
+    SUBMIT_TEXT_SELECTOR = ", ".join([
+        'button:has-text("Login")',
+        'button:has-text("Đăng nhập")'
+    ])
+
+    # A selector list matches in document order, so the specific login errors come first
+    # and the generic class patterns are only tried when none of them is present
+    ERROR_SELECTOR = ", ".join([
+        '.login-error', '.alert-danger'
+    ])
+
+    ERROR_FALLBACK_SELECTOR = ", ".join([
+        '.error', '[class*="error"]', '[class*="alert"]'
+    ])
+
+    IP_SERVICES = [
+        "https://api.ipify.org",
+        "https://ifconfig.me/ip",
+        "https://icanhazip.com"
+    ]
+
+    IPV4_PATTERN = re.compile(r'^(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)$')
+
+    # reCAPTCHA v3 has no [data-sitekey] and attaches its iframe only after api.js loads,
+    # so also match the token field that is present in the static login markup
+    RECAPTCHA_SELECTOR = 'iframe[src*="recaptcha"], [data-sitekey], input[name="recaptchaToken"]'
+
+    # Resolves true as soon as reCAPTCHA reports completion, or false after `timeout` ms
+    RECAPTCHA_WAIT_SCRIPT = '''
+        (timeout) => new Promise(resolve => {
+            const done = () => {
+                // Check if grecaptcha object exists and has a response
+                if (typeof grecaptcha !== 'undefined') {
+                    try {
+                        const response = grecaptcha.getResponse();
+                        if (response && response.length > 0) {
+                            return true;
+                        }
+                    } catch (e) {
+                        // Ignore errors
+                    }
+                }
+
+                // Check for completed visual indicators
+                if (document.querySelector('.recaptcha-checkbox-checked, .recaptcha-success')) {
+                    return true;
+                }
+
+                // Check for hidden reCAPTCHA completion
+                for (const input of document.querySelectorAll('input[name="recaptchaToken"]')) {
+                    if (input.value && input.value.length > 0) {
+                        return true;
+                    }
+                }
+
+                return false;
+            };
+
+            if (done()) {
+                return resolve(true);
+            }
+
+            const finish = (result) => {
+                observer.disconnect();
+                clearInterval(poll);
+                clearTimeout(timer);
+                resolve(result);
+            };
+            const observer = new MutationObserver(() => done() && finish(true));
+            observer.observe(document.documentElement, {
+                subtree: true, childList: true, attributes: true, attributeFilter: ['class', 'value']
+            });
+            // grecaptcha.getResponse() and input.value changes do not always mutate the DOM
+            const poll = setInterval(() => done() && finish(true), 250);
+            const timer = setTimeout(() => finish(false), timeout);
+        })
+    '''
+
+    DNS_TABLE_SELECTOR = 'table td'
+
+    # Login error classification: captcha failures are worth retrying, rejected credentials are not
+    CAPTCHA_ERROR_KEYWORDS = ['captcha']
+    CREDENTIAL_ERROR_KEYWORDS = ['password', 'mật khẩu']
+    ACCOUNT_ERROR_KEYWORDS = ['tài khoản', 'username']
+    REJECTED_ERROR_KEYWORDS = ['sai', 'không đúng', 'incorrect', 'invalid']
+
+    # Resources the updater never needs, blocked by URL in Chromium itself. Unlike a Playwright
+    # route this keeps the HTTP cache enabled and adds no per-request round-trip to Python.
+    BLOCKED_EXTENSIONS = [
+        'png', 'jpg', 'jpeg', 'gif', 'svg', 'ico', 'webp',
+        'woff', 'woff2', 'ttf', 'otf', 'mp4', 'webm'
+    ]
+    # Each extension is matched both bare and with a cache-busting query string (logo.png?v=3)
+    BLOCKED_URL_PATTERNS = [
+        '*googletagmanager.com*', '*google-analytics.com*', '*doubleclick.net*',
+        *(pattern for ext in BLOCKED_EXTENSIONS for pattern in (f'*.{ext}', f'*.{ext}?*'))
     ]
 
-    ERROR_SELECTORS = [
-        '.error', '.alert-danger', '.login-error',
-        '[class*="error"]', '[class*="alert"]'
+    # Startup flags that trim Chromium cold start; config args override flags of the same name
+    DEFAULT_BROWSER_ARGS = [
+        '--disable-blink-features=AutomationControlled',
+        '--disable-extensions',
+        '--disable-background-timer-throttling',
+        '--disable-backgrounding-occluded-windows',
+        '--disable-renderer-backgrounding',
+        '--no-first-run',
+        '--no-default-browser-check',
+        '--disable-features=Translate,BackForwardCache',
+        '--disable-dev-shm-usage'
     ]
 
+    # JSON fields of the DNS update response that must match between the browser and a replay
+    SUCCESS_MARKER_KEYS = ['success', 'Success', 'status', 'Status', 'code', 'Code']
+
+    SESSION_COOKIE_NAMES = ['PHPSESSID', '.ASPXAUTH', 'ASP.NET_SessionId']
+
     DNS_SETTINGS_URL = "https://domain.tenten.vn/ApiDnsSetting"
-    LOGIN_TIMEOUT = 15000
-    RECAPTCHA_TIMEOUT = 2000
-    NETWORK_IDLE_TIMEOUT = 10000
+    DOMAIN_URL = "https://domain.tenten.vn"
+    LOGIN_TIMEOUT = 10000
+    RECAPTCHA_TIMEOUT = 30000
+    RECAPTCHA_PROBE_TIMEOUT = 500
+    RECAPTCHA_RETRY_INTERVAL = 0.25
+    # Evaluate errors caused by the page navigating away; anything else is not retried
+    NAVIGATION_ERROR_MARKERS = ['Execution context was destroyed', 'Cannot find context', 'navigation']
+    NETWORK_IDLE_TIMEOUT = 8000
+    ADAPTIVE_TIMEOUT_SAMPLES = 20
+    ADAPTIVE_TIMEOUT_MIN_SAMPLES = 5
+    ADAPTIVE_TIMEOUT_FLOOR = 1000
+    IP_SERVICE_TIMEOUT = 10
+    IP_CACHE_TTL = 30
+    DAEMON_INTERVAL = 300
+    DNS_CACHE_TTL = 300
+    # In daemon mode aiohttp's DNS cache outlives this many intervals, so consecutive cycles reuse it
+    DNS_CACHE_INTERVALS = 3
+    LOGIN_ATTEMPTS = 3
+    STATE_MAX_AGE = 6 * 60 * 60
 
     def __init__(self, config_path: str = "config.json"):
         self.config = self.load_config(config_path)
         self.logger = self.setup_logging()
+        self.playwright = None
         self.page: Optional[Page] = None
         self.browser : Optional[BrowserContext] = None
+        timeouts = self.config.get("timeouts", {})
+        self.login_timeout = timeouts.get("login_ms", self.LOGIN_TIMEOUT)
+        self.network_idle_timeout = timeouts.get("networkidle_ms", self.NETWORK_IDLE_TIMEOUT)
+        self.recaptcha_timeout = timeouts.get("recaptcha_ms", self.RECAPTCHA_TIMEOUT)
+        self._wait_durations: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=self.ADAPTIVE_TIMEOUT_SAMPLES))
+        self._login_error: Optional[str] = None
+        self._api_request: Optional[Dict[str, Any]] = None
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._ip_cache: Optional[Tuple[str, float]] = None
+        self._dns_cache_ttl = self.DNS_CACHE_TTL
+        self._state_path = self.config.get("state_file", ".ddns_state.json")
 
     def load_config(self, config_path: str) -> Dict[str, Any]:
         """Load configuration from JSON file"""
@@ -63,6 +212,36 @@ class TentenDDNSUpdater:
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON in config file: {e}")
 
+    def load_state(self) -> Dict[str, Any]:
+        """Load the last successfully applied IP from the state file"""
+        try:
+            with open(self._state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable state file {self._state_path}: {e}")
+            return {}
+
+    def save_state(self, **updates: Any):
+        """Atomically merge updates into the state file"""
+        state = self.load_state()
+        state.update(updates)
+        state_dir = os.path.dirname(os.path.abspath(self._state_path))
+        try:
+            # mkstemp creates the file owner-only, which matters once session cookies are stored
+            fd, tmp_path = tempfile.mkstemp(dir=state_dir, prefix=".ddns_state.", suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self._state_path)
+        except OSError as e:
+            self.logger.warning(f"Could not write state file {self._state_path}: {e}")
+
+    def is_ip_unchanged(self, ip: str) -> bool:
+        """Check whether the IP was already applied recently according to the state file"""
+        state = self.load_state()
+        return state.get("last_ip") == ip and time.time() - state.get("ts", 0) < self.STATE_MAX_AGE
+
     def setup_logging(self) -> logging.Logger:
         """Setup logging configuration"""
         log_config = self.config.get("logging", {})
@@ -76,8 +255,13 @@ class TentenDDNSUpdater:
         console_handler = logging.StreamHandler()
         console_handler.setLevel(log_level)
 
-        # File handler
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        # File handler, rotated so the log cannot grow without bound
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=log_config.get("max_bytes", 1024 * 1024),
+            backupCount=log_config.get("backup_count", 3),
+            encoding='utf-8'
+        )
         file_handler.setLevel(log_level)
 
         # Formatter
@@ -87,30 +271,87 @@ class TentenDDNSUpdater:
         console_handler.setFormatter(formatter)
         file_handler.setFormatter(formatter)
 
-        logger.addHandler(console_handler)
-        logger.addHandler(file_handler)
+        # Hand records to a background thread so log I/O stays off the event loop
+        log_queue = queue.Queue(-1)
+        self._log_listener = logging.handlers.QueueListener(
+            log_queue, console_handler, file_handler, respect_handler_level=True
+        )
+        self._log_listener.start()
+        atexit.register(self.stop_logging)
+
+        logger.addHandler(logging.handlers.QueueHandler(log_queue))
 
         return logger
 
+    def stop_logging(self):
+        """Flush queued log records and stop the background listener"""
+        if self._log_listener:
+            self._log_listener.stop()
+            self._log_listener = None
+
+    def get_http_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it on first use"""
+        if self._http is None or self._http.closed:
+            connector = aiohttp.TCPConnector(limit=4, keepalive_timeout=60, ttl_dns_cache=self._dns_cache_ttl)
+            self._http = aiohttp.ClientSession(connector=connector)
+        return self._http
+
+    async def prewarm_dns(self):
+        """Resolve the tenten host early so the lookup overlaps with IP detection and browser launch"""
+        # The IP service hosts are left out: get_current_ip resolves them straight away through
+        # aiohttp's own DNS cache, so warming them here would only duplicate those lookups
+        host = urlparse(self.DOMAIN_URL).hostname
+        try:
+            await asyncio.get_running_loop().getaddrinfo(host, 443)
+        except OSError as e:
+            self.logger.debug(f"DNS prewarm failed for {host}: {e}")
+
+    async def fetch_ip(self, service: str) -> str:
+        """Fetch public IP address from a single service"""
+        if self.browser is not None:
+            # Share the browser's connection pool and DNS cache once it is running
+            response = await self.browser.request.get(service, timeout=self.IP_SERVICE_TIMEOUT * 1000)
+            try:
+                status, text = response.status, await response.text()
+            finally:
+                # The context keeps response bodies until disposed, and in daemon mode it never closes
+                await response.dispose()
+        else:
+            async with self.get_http_session().get(
+                    service, timeout=aiohttp.ClientTimeout(total=self.IP_SERVICE_TIMEOUT)) as response:
+                status, text = response.status, await response.text()
+
+        if status != 200:
+            raise Exception(f"{service} returned HTTP {status}")
+        ip = text.strip()
+        if not self.IPV4_PATTERN.match(ip):
+            raise Exception(f"{service} returned invalid IP: {ip!r}")
+        return ip
+
     async def get_current_ip(self) -> str:
         """Get current public IP address"""
-        try:
-            # Using multiple IP services for reliability
-            services = [
-                "https://api.ipify.org",
-                "https://ifconfig.me/ip",
-                "https://icanhazip.com"
-            ]
+        if self._ip_cache and time.monotonic() - self._ip_cache[1] < self.IP_CACHE_TTL:
+            self.logger.debug(f"Using cached public IP: {self._ip_cache[0]}")
+            return self._ip_cache[0]
 
-            for service in services:
-                try:
-                    response = requests.get(service, timeout=10)
-                    if response.status_code == 200:
-                        ip = response.text.strip()
+        try:
+            # Query all IP services concurrently and take the first valid answer
+            tasks = [asyncio.create_task(self.fetch_ip(service)) for service in self.IP_SERVICES]
+            try:
+                pending = set(tasks)
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is not None:
+                            self.logger.debug(f"IP service failed: {task.exception()}")
+                            continue
+                        ip = task.result()
+                        self._ip_cache = (ip, time.monotonic())
                         self.logger.info(f"Current public IP: {ip}")
                         return ip
-                except requests.RequestException:
-                    continue
+            finally:
+                for task in tasks:
+                    task.cancel()
 
             raise Exception("Could not determine public IP address")
 
@@ -118,6 +359,24 @@ class TentenDDNSUpdater:
             self.logger.error(f"Error getting current IP: {e}")
             raise
 
+    def build_browser_args(self, browser_settings: Dict[str, Any]) -> List[str]:
+        """Merge the default performance flags with the configured browser args"""
+        defaults = list(self.DEFAULT_BROWSER_ARGS)
+        if browser_settings.get("headless", False):
+            defaults.append('--disable-gpu')
+
+        ignore_default_args = browser_settings.get("ignore_default_args")
+        if ignore_default_args is True:
+            # Playwright drops all of its default args in this case, so skip ours as well
+            defaults = []
+        elif ignore_default_args:
+            defaults = [arg for arg in defaults if arg not in ignore_default_args]
+
+        configured = browser_settings.get("args") or []
+        configured_names = {arg.split("=", 1)[0] for arg in configured}
+        merged = [arg for arg in defaults if arg.split("=", 1)[0] not in configured_names]
+        return merged + [arg for arg in configured if arg not in merged]
+
     async def init_browser(self):
         """Initialize Playwright browser"""
         try:
@@ -126,7 +385,7 @@ class TentenDDNSUpdater:
 
             self.browser = await self.playwright.chromium.launch_persistent_context(
                 headless=browser_settings.get("headless", False),
-                args=browser_settings.get("args"),
+                args=self.build_browser_args(browser_settings),
                 ignore_default_args= browser_settings.get("ignore_default_args"),
                 user_agent=browser_settings.get("user_agent", ""),
                 user_data_dir=browser_settings.get("user_data_dir", ""),
@@ -137,6 +396,9 @@ class TentenDDNSUpdater:
             )
 
             self.page = self.browser.pages[0] if self.browser.pages else await self.browser.new_page()
+
+            if browser_settings.get("block_resources", True):
+                await self.block_resources(self.page)
             self.page.set_default_timeout(browser_settings.get("timeout", 30000))
 
             self.logger.info("Browser initialized successfully")
@@ -145,94 +407,166 @@ class TentenDDNSUpdater:
             self.logger.error(f"Error initializing browser: {e}")
             raise
 
-    async def find_element(self, selectors: List[str], context: Optional[Any] = None) -> Optional[Any]:
-        """Helper method to find an element using multiple selectors"""
+    async def block_resources(self, page: Page):
+        """Block analytics, images, fonts and media for the page at the CDP level"""
+        try:
+            cdp = await self.browser.new_cdp_session(page)
+            await cdp.send("Network.enable")
+            await cdp.send("Network.setBlockedURLs", {"urls": self.BLOCKED_URL_PATTERNS})
+        except Exception as e:
+            self.logger.warning(f"Could not enable resource blocking: {e}")
+
+    async def _ensure_browser_context(self):
+        """Reuse the live persistent context, launching the browser only when needed"""
+        if self.browser is not None and self.page is not None and not self.page.is_closed():
+            return
+        if self.browser is not None:
+            await self.close_browser()
+        await self.init_browser()
+
+    def adaptive_timeout(self, site: str, configured: int) -> int:
+        """Shrink a configured timeout to twice the p95 of recent successful waits at this call site"""
+        samples = self._wait_durations[site]
+        if len(samples) < self.ADAPTIVE_TIMEOUT_MIN_SAMPLES:
+            return configured
+        p95 = statistics.quantiles(samples, n=20)[-1]
+        return int(min(configured, max(2 * p95, self.ADAPTIVE_TIMEOUT_FLOOR)))
+
+    async def adaptive_wait(self, site: str, configured: int, wait: Callable[[int], Awaitable[Any]]) -> Any:
+        """Run a Playwright wait with an adaptive timeout and record how long it took"""
+        timeout = self.adaptive_timeout(site, configured)
+        started = time.monotonic()
+        try:
+            result = await wait(timeout)
+        except PlaywrightTimeoutError:
+            # Forget the history so a slower page gets the full configured timeout next time
+            self._wait_durations[site].clear()
+            if timeout >= configured:
+                raise
+            # The shrunk timeout was only a guess: spend the rest of the configured budget before failing
+            self.logger.debug(f"Adaptive timeout of {timeout}ms expired at {site}, "
+                              f"waiting up to {configured - timeout}ms more")
+            result = await wait(configured - timeout)
+        self._wait_durations[site].append((time.monotonic() - started) * 1000)
+        return result
+
+    async def find_element(self, selector: str, fallback_selector: Optional[str] = None,
+                           context: Optional[Any] = None) -> Optional[Any]:
+        """Helper method to find an element using a comma-joined selector, then an optional fallback"""
         search_context = context or self.page
-        for selector in selectors:
+        for candidate in (selector, fallback_selector):
+            if not candidate:
+                continue
             try:
-                element = await search_context.query_selector(selector)
+                element = await search_context.query_selector(candidate)
                 if element:
-                    await element.focus() if await element.evaluate('el => el.tagName.toLowerCase() in ["input", "textarea"]') else None
+                    await element.evaluate('el => ["input", "textarea"].includes(el.tagName.toLowerCase()) && el.focus()')
                     return element
-            except:
-                continue
+            except Exception as e:
+                self.logger.debug(f"Element lookup failed for {candidate}: {e}")
         return None
 
+    def classify_login_error(self, error_text: str) -> str:
+        """Return 'auth' for rejected credentials and 'other' for errors worth retrying"""
+        lowered = error_text.lower()
+        if any(k in lowered for k in self.CAPTCHA_ERROR_KEYWORDS):
+            return 'other'
+        if any(k in lowered for k in self.CREDENTIAL_ERROR_KEYWORDS):
+            return 'auth'
+        if (any(k in lowered for k in self.ACCOUNT_ERROR_KEYWORDS)
+                and any(k in lowered for k in self.REJECTED_ERROR_KEYWORDS)):
+            return 'auth'
+        return 'other'
+
     async def check_login_status(self) -> bool:
         """Check if login was successful and handle errors"""
         current_url = self.page.url
         if "login" not in current_url.lower():
             return True
 
-        error_element = await self.find_element(self.ERROR_SELECTORS)
+        error_element = await self.find_element(self.ERROR_SELECTOR, self.ERROR_FALLBACK_SELECTOR)
         if error_element:
             error_text = await error_element.inner_text()
             self.logger.error(f"Login error: {error_text}")
+            self._login_error = self.classify_login_error(error_text)
             return False
 
         self.logger.error("Login failed - still on login page")
+        self._login_error = 'other'
         return False
 
-    async def wait_for_recaptcha_completion(self, timeout: int = 30) -> bool:
-        """Wait for reCAPTCHA to complete with periodic checks"""
-        start_time = asyncio.get_event_loop().time()
-
-        while asyncio.get_event_loop().time() - start_time < timeout:
-            # Check if reCAPTCHA is completed
-            completed = await self.page.evaluate('''
-                () => {
-                    // Check for reCAPTCHA v3 completion indicators
-                    const recaptchaElements = document.querySelectorAll('[data-sitekey]');
-                    const iframes = document.querySelectorAll('iframe[src*="recaptcha"]');
-                    
-                    // Check if grecaptcha object exists and has a response
-                    if (typeof grecaptcha !== 'undefined') {
-                        try {
-                            const response = grecaptcha.getResponse();
-                            if (response && response.length > 0) {
-                                return true;
-                            }
-                        } catch (e) {
-                            // Ignore errors
-                        }
-                    }
-                    
-                    // Check for completed visual indicators
-                    const completedElements = document.querySelectorAll('.recaptcha-checkbox-checked, .recaptcha-success');
-                    if (completedElements.length > 0) {
-                        return true;
-                    }
-                    
-                    // Check for hidden reCAPTCHA completion
-                    const hiddenInputs = document.querySelectorAll('input[name="recaptchaToken"]');
-                    for (const input of hiddenInputs) {
-                        if (input.value && input.value.length > 0) {
-                            return true;
-                        }
-                    }
-                    
-                    return false;
-                }
-            ''')
-
-            if completed:
-                return True
+    async def wait_for_recaptcha_completion(self, timeout: float = 30) -> bool:
+        """Wait for reCAPTCHA to complete, resolving in-page as soon as the DOM reports completion"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
 
-            # TODO: Continue human-like behavior while waiting
-            await asyncio.sleep(random.uniform(0.5, 1.0))
+        # Safety net: re-arm the in-page wait if a navigation destroys its execution context
+        while loop.time() < deadline:
+            remaining_ms = int((deadline - loop.time()) * 1000)
+            try:
+                return await self.page.evaluate(self.RECAPTCHA_WAIT_SCRIPT, remaining_ms)
+            except PlaywrightError as e:
+                if not any(marker in str(e) for marker in self.NAVIGATION_ERROR_MARKERS):
+                    raise
+                self.logger.debug(f"reCAPTCHA wait interrupted by navigation, retrying: {e}")
+                await asyncio.sleep(self.RECAPTCHA_RETRY_INTERVAL)
 
         return False
 
+    async def resume_session(self) -> bool:
+        """Open DNS settings directly when the persistent profile still holds a session cookie"""
+        try:
+            cookies = await self.browser.cookies(self.DOMAIN_URL)
+            now = time.time()
+            session_cookie = next((c for c in cookies if c["name"] in self.SESSION_COOKIE_NAMES
+                                   and (c["expires"] == -1 or c["expires"] > now)), None)
+            if not session_cookie:
+                self.logger.debug("No session cookie found, login required")
+                return False
+
+            self.logger.info(f"Found session cookie {session_cookie['name']}, opening DNS settings...")
+            await self.page.goto(self.DNS_SETTINGS_URL, wait_until='domcontentloaded')
+            if "login" in self.page.url.lower():
+                self.logger.info("Session expired, login required")
+                return False
+            return True
+
+        except Exception as e:
+            self.logger.warning(f"Could not resume session: {e}")
+            return False
+
+    async def fill_login_form(self, username: str, password: str) -> bool:
+        """Set username and password in a single evaluate, returning False if either field did not take"""
+        return await self.page.evaluate('''
+            ([userSel, passSel, u, p]) => {
+                const set = (el, v) => {
+                    // Anything else (e.g. a wrapper div) would make the native setter throw
+                    if (!(el instanceof HTMLInputElement || el instanceof HTMLTextAreaElement)) {
+                        return false;
+                    }
+                    // Use the native setter so framework-controlled inputs notice the change
+                    const proto = el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+                    Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, v);
+                    el.dispatchEvent(new Event('input', { bubbles: true }));
+                    el.dispatchEvent(new Event('change', { bubbles: true }));
+                    return el.value === v;
+                };
+                const userOk = set(document.querySelector(userSel), u);
+                const passOk = set(document.querySelector(passSel), p);
+                return userOk && passOk;
+            }
+        ''', [self.USERNAME_SELECTOR, self.PASSWORD_SELECTOR, username, password])
+
     async def login(self) -> bool:
         """Login to tenten.vn domain management"""
+        self._login_error = None
         try:
-            await self.page.wait_for_load_state('networkidle', timeout=self.NETWORK_IDLE_TIMEOUT)
             credentials = self.config["credentials"]
             username = credentials["username"]
             password = credentials["password"]
 
             self.logger.info("Navigating to DNS settings page...")
-            await self.page.goto(self.DNS_SETTINGS_URL)
+            await self.page.goto(self.DNS_SETTINGS_URL, wait_until='domcontentloaded')
 
             # Check if already logged in
             if "login" not in self.page.url.lower():
@@ -240,43 +574,52 @@ class TentenDDNSUpdater:
                 return True
 
             self.logger.info("Redirected to login page, attempting login...")
-            await self.page.wait_for_selector('input[name="username"], input[type="email"], #username',
-                                            timeout=self.LOGIN_TIMEOUT)
-
-            # Find and fill username field
-            username_field = await self.find_element(self.USERNAME_SELECTORS)
-            if not username_field:
-                raise Exception("Could not find username/email field")
-            await username_field.fill(username)
-
-            await self.page.wait_for_timeout(1000)  # Wait for a second to
-
-            # Find and fill password field
-            password_field = await self.find_element(self.PASSWORD_SELECTORS)
-            if not password_field:
-                raise Exception("Could not find password field")
-            await password_field.fill(password)
-
-            await self.page.wait_for_timeout(1000)
+            await self.adaptive_wait("login_form", self.login_timeout,
+                                     lambda t: self.page.wait_for_selector(self.USERNAME_SELECTOR, timeout=t))
+
+            # Set both credentials in one round-trip, falling back to fill() if the page rejects it
+            if not await self.fill_login_form(username, password):
+                self.logger.debug("Direct form fill failed, falling back to fill()")
+                # The form fields are all present at DOMContentLoaded, so look them up concurrently
+                username_field, password_field = await asyncio.gather(
+                    self.find_element(self.USERNAME_SELECTOR),
+                    self.find_element(self.PASSWORD_SELECTOR)
+                )
+                if not username_field:
+                    raise Exception("Could not find username/email field")
+                if not password_field:
+                    raise Exception("Could not find password field")
+
+                # Fill sequentially: fill() types into the focused element, so concurrent fills could interleave
+                await username_field.fill(username)
+                await password_field.fill(password)
 
             # Submit form
-            submit_btn = await self.find_element(self.SUBMIT_SELECTORS)
+            submit_btn = await self.find_element(self.SUBMIT_SELECTOR, self.SUBMIT_TEXT_SELECTOR)
             if not submit_btn:
                 raise Exception("Could not find submit button")
 
-            await self.page.wait_for_load_state('networkidle', timeout=self.NETWORK_IDLE_TIMEOUT)
-            await self.page.wait_for_timeout(5000)  # Wait for any potential reCAPTCHA to load
-            await self.wait_for_recaptcha_completion()
+            # Only wait for reCAPTCHA when the page actually embeds one
+            try:
+                await self.page.wait_for_selector(self.RECAPTCHA_SELECTOR, state='attached',
+                                                  timeout=self.RECAPTCHA_PROBE_TIMEOUT)
+                await self.wait_for_recaptcha_completion(self.recaptcha_timeout / 1000)
+            except PlaywrightTimeoutError:
+                self.logger.debug("No reCAPTCHA found on login page")
             await submit_btn.click()
 
-            # Wait for navigation and check login status
-            await self.page.wait_for_load_state("networkidle", timeout=self.LOGIN_TIMEOUT)
+            # Wait for navigation away from the login page and check login status
+            try:
+                await self.adaptive_wait("login_submit", self.login_timeout,
+                                         lambda t: self.page.wait_for_url(lambda url: "login" not in url.lower(),
+                                                                          timeout=t))
+            except PlaywrightTimeoutError:
+                pass
             if not await self.check_login_status():
                 return False
 
             self.logger.info("Login successful")
-            await self.page.goto(self.DNS_SETTINGS_URL)
-            await self.page.wait_for_load_state("networkidle", timeout=self.NETWORK_IDLE_TIMEOUT)
+            await self.page.goto(self.DNS_SETTINGS_URL, wait_until='domcontentloaded')
             return True
 
         except Exception as e:
@@ -286,12 +629,12 @@ class TentenDDNSUpdater:
     async def update_dns_record(self, new_ip: str) -> bool:
         """Update DNS A record with new IP"""
         try:
-            await self.page.wait_for_load_state("networkidle", timeout=self.NETWORK_IDLE_TIMEOUT)
             domain_settings = self.config["domain_settings"]
             configuration_by_ip_btn_text = domain_settings["configuration_by_ip_btn_text"]
 
             self.logger.info(f"Updating DNS record to {new_ip}")
-            await self.page.wait_for_load_state("networkidle", timeout=self.NETWORK_IDLE_TIMEOUT)
+            await self.adaptive_wait("dns_table", self.network_idle_timeout,
+                                     lambda t: self.page.wait_for_selector(self.DNS_TABLE_SELECTOR, timeout=t))
 
             # Find domain row or DNS management interface
             domain_selectors = [
@@ -310,32 +653,61 @@ class TentenDDNSUpdater:
                     continue
             if not is_exiting_domain:
                 self.logger.warning(f"{new_ip} not found, configuration by IP")
-                configuration_by_ip_selectors = [
+                configuration_by_ip_text_selector = ", ".join([
                     f'tr:has-text("{configuration_by_ip_btn_text}")',
-                    'li.ip_popup > a',
                     f'li:has-text("{configuration_by_ip_btn_text}") a',
-                ]
-                configuration_by_ip_btn = await self.find_element(configuration_by_ip_selectors)
+                ])
+                configuration_by_ip_btn = await self.find_element('li.ip_popup > a', configuration_by_ip_text_selector)
                 if not configuration_by_ip_btn:
                     self.logger.error(f"Could not find configuration by IP button for {new_ip}")
                     return False
 
                 self.logger.info(f"Found configuration by IP button: {configuration_by_ip_btn_text}")
                 await configuration_by_ip_btn.click()
-                await self.page.wait_for_timeout(1000)
-                ip_input = await self.find_element(['#ip', 'input[type="text"]'])
+                # Wait for the popup's own input; any text input already on the page would match too early
+                try:
+                    await self.page.wait_for_selector('#ip', state='visible', timeout=self.network_idle_timeout)
+                except PlaywrightTimeoutError:
+                    self.logger.debug("#ip did not appear, waiting for a generic text input")
+                    await self.page.wait_for_selector('input[type="text"]', state='visible',
+                                                      timeout=self.network_idle_timeout)
+                ip_input = await self.find_element('#ip', 'input[type="text"]')
                 if not ip_input:
                     self.logger.error("Could not find IP input field in configuration by IP form")
                     return False
                 await ip_input.fill(new_ip)
-                submit_btn = await self.find_element(['#send', 'button[type="submit"]'])
+                submit_btn = await self.find_element('#send', 'button[type="submit"]')
                 if not submit_btn:
                     self.logger.error("Could not find submit button in configuration by IP form")
                     return False
-                await submit_btn.click()
+                # Wait for the server to acknowledge the submission before reporting success
+                async with self.page.expect_response(lambda r: "ApiDnsSetting" in r.url and r.ok,
+                                                     timeout=self.network_idle_timeout) as response_info:
+                    await submit_btn.click()
                 self.logger.info(f"Configuration by IP submitted for {new_ip}")
-                await self.page.wait_for_load_state("networkidle", timeout=self.NETWORK_IDLE_TIMEOUT)
-                await self.page.wait_for_timeout(5000)
+
+                # Remember the submission so later runs can replay it without the browser, but only
+                # when the response carries a marker that lets a replay prove it succeeded too.
+                # This is optional: the update itself is already confirmed.
+                try:
+                    response = await response_info.value
+                    success_marker = self.get_success_marker(response.headers.get("content-type", ""),
+                                                             await response.text())
+                    if success_marker:
+                        request = response.request
+                        self._api_request = {
+                            "method": request.method,
+                            "url": request.url,
+                            "post_data": request.post_data,
+                            "headers": {k: v for k, v in request.headers.items()
+                                        if k.lower() not in ("cookie", "content-length", "host")},
+                            "ip": new_ip,
+                            "success_marker": success_marker
+                        }
+                    else:
+                        self.logger.debug("DNS update response has no success marker, direct replay disabled")
+                except Exception as e:
+                    self.logger.debug(f"Could not record DNS update request for replay: {e}")
                 self.logger.info(f"Updated config with new IP: {new_ip}")
                 return True
             else:
@@ -346,49 +718,193 @@ class TentenDDNSUpdater:
             self.logger.error(f"Error updating DNS record: {e}")
             return False
 
-    async def cleanup(self):
-        """Clean up browser resources"""
+    def is_direct_api_enabled(self) -> bool:
+        """Check whether DNS updates may be replayed directly with stored session cookies"""
+        return self.config.get("domain_settings", {}).get("direct_api", True)
+
+    def get_success_marker(self, content_type: str, body: str) -> Optional[Dict[str, Any]]:
+        """Extract the scalar success fields from a JSON DNS update response"""
+        if "json" not in content_type.lower():
+            return None
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        marker = {k: data[k] for k in self.SUCCESS_MARKER_KEYS
+                  if k in data and isinstance(data[k], (bool, int, float, str))}
+        return marker or None
+
+    async def update_via_api(self, new_ip: str) -> bool:
+        """Replay the recorded configuration-by-IP request with saved cookies, bypassing the browser"""
+        if not self.is_direct_api_enabled():
+            return False
+
+        state = self.load_state()
+        api_request = state.get("api_request")
+        cookies = state.get("cookies")
+        if not api_request or not cookies or not api_request.get("success_marker"):
+            return False
+
+        # Match the old IP only as a whole address, so 1.2.3.4 never rewrites part of 11.2.3.45
+        ip_pattern = re.compile(rf'(?<![\d.]){re.escape(api_request["ip"])}(?![\d.])')
+        url, url_matches = ip_pattern.subn(lambda _: new_ip, api_request["url"])
+        post_data, body_matches = ip_pattern.subn(lambda _: new_ip, api_request.get("post_data") or "")
+        if url_matches + body_matches != 1:
+            self.logger.debug(f"Recorded DNS request carries the IP {url_matches + body_matches} times, "
+                              f"using the browser")
+            return False
+
+        now = time.time()
+        headers = dict(api_request.get("headers") or {})
+        headers["Cookie"] = "; ".join(f"{c['name']}={c['value']}" for c in cookies
+                                      if c.get("expires", -1) == -1 or c["expires"] > now)
+
+        try:
+            self.logger.info(f"Updating DNS record to {new_ip} via direct request")
+            async with self.get_http_session().request(
+                    api_request["method"], url, data=post_data.encode("utf-8") if post_data else None,
+                    headers=headers, allow_redirects=False,
+                    timeout=aiohttp.ClientTimeout(total=self.network_idle_timeout / 1000)) as response:
+                if response.status in (401, 403) or 300 <= response.status < 400:
+                    self.logger.info(f"Direct request rejected (HTTP {response.status}), session expired")
+                    self.save_state(cookies=None)
+                    return False
+                if response.status != 200:
+                    self.logger.warning(f"Direct request failed with HTTP {response.status}")
+                    return False
+                # A 200 can still be an error payload or a login page, so compare against the marker
+                # the browser saw on a confirmed update
+                success_marker = self.get_success_marker(response.headers.get("Content-Type", ""),
+                                                         await response.text())
+                if success_marker != api_request["success_marker"]:
+                    self.logger.warning(f"Direct request did not confirm the update ({success_marker}), "
+                                        f"falling back to browser")
+                    return False
+
+            self.logger.info(f"DNS update successful via direct request! New IP: {new_ip}")
+            self.save_state(last_ip=new_ip, ts=time.time(),
+                            api_request={**api_request, "url": url, "post_data": post_data or None, "ip": new_ip})
+            return True
+
+        except Exception as e:
+            self.logger.warning(f"Direct DNS request failed, falling back to browser: {e}")
+            return False
+
+    async def close_browser(self):
+        """Close the browser context and stop Playwright"""
         try:
             await self.page.close() if self.page else None
             await self.browser.close() if self.browser else None
-            await self.playwright.stop() if hasattr(self, 'playwright') else None
+            await self.playwright.stop() if self.playwright else None
+        finally:
+            self.page = None
+            self.browser = None
+            self.playwright = None
+
+    async def cleanup(self):
+        """Clean up browser resources"""
+        try:
+            await self.close_browser()
+            await self._http.close() if self._http else None
             self.logger.info("Browser cleanup completed")
         except Exception as e:
             self.logger.error(f"Error during cleanup: {e}")
+        finally:
+            self.stop_logging()
+
+    async def update(self, target_ip: str) -> bool:
+        """Login and update DNS, preferring a direct request over the browser"""
+        if await self.update_via_api(target_ip):
+            return True
+
+        await self._ensure_browser_context()
+
+        # Reuse the stored session when possible, otherwise login
+        success = await self.resume_session()
+        if success:
+            self.logger.info("Already logged in, skipping login")
+        else:
+            for attempt in range(self.LOGIN_ATTEMPTS):
+                success = await self.login()
+                if success:
+                    break
+                if self._login_error == 'auth':
+                    self.logger.error("Credentials rejected, not retrying login")
+                    break
+                if attempt < self.LOGIN_ATTEMPTS - 1:
+                    delay = 2 ** attempt
+                    self.logger.info(f"Retrying login in {delay}s...")
+                    await asyncio.sleep(delay)
+
+        if success:
+            success = await self.update_dns_record(target_ip)
+            if success:
+                self.logger.info(f"DNS update successful! New IP: {target_ip}")
+                state: Dict[str, Any] = {"last_ip": target_ip, "ts": time.time()}
+                if self.is_direct_api_enabled():
+                    state["cookies"] = await self.browser.cookies(self.DOMAIN_URL)
+                    if self._api_request:
+                        state["api_request"] = self._api_request
+                else:
+                    # Never keep session cookies on disk when direct replay is off
+                    state["cookies"] = None
+                    state["api_request"] = None
+                self.save_state(**state)
+                return True
+            else:
+                self.logger.error("DNS update failed")
+                return False
+        else:
+            self.logger.error("Login failed")
+            return False
 
     async def run(self, target_ip: Optional[str] = None) -> bool:
         """Main execution method"""
+        prewarm = asyncio.create_task(self.prewarm_dns())
         try:
             # Get current IP if not provided
             if target_ip is None:
                 target_ip = await self.get_current_ip()
 
-            # Initialize browser
-            await self.init_browser()
-
-            # Login and update DNS
-            success = await self.login()
-            attempts = 3
-            retries = 0
-            while not success and retries < attempts:
-                retries += 1
-                success = await self.login()
+            if self.is_ip_unchanged(target_ip):
+                self.logger.info(f"IP unchanged ({target_ip}), skipping")
+                return True
 
-            if success:
-                success = await self.update_dns_record(target_ip)
-                if success:
-                    self.logger.info(f"DNS update successful! New IP: {target_ip}")
-                    return True
-                else:
-                    self.logger.error("DNS update failed")
-                    return False
-            else:
-                self.logger.error("Login failed")
-                return False
+            return await self.update(target_ip)
 
         except Exception as e:
             self.logger.error(f"Execution failed: {e}")
             return False
+        finally:
+            prewarm.cancel()
+            await self.cleanup()
+
+    async def run_daemon(self, interval: int = DAEMON_INTERVAL, target_ip: Optional[str] = None):
+        """Keep the browser alive and update DNS whenever the IP changes"""
+        self.logger.info(f"Starting daemon mode, checking every {interval}s")
+        self._dns_cache_ttl = self.DNS_CACHE_INTERVALS * interval
+        try:
+            while True:
+                prewarm = asyncio.create_task(self.prewarm_dns())
+                try:
+                    current_ip = target_ip or await self.get_current_ip()
+                    if self.is_ip_unchanged(current_ip):
+                        self.logger.debug(f"IP unchanged ({current_ip}), nothing to do")
+                    else:
+                        await self.update(current_ip)
+                except Exception as e:
+                    self.logger.error(f"Update cycle failed: {e}")
+                    # Drop a possibly broken browser so the next cycle relaunches it
+                    try:
+                        await self.close_browser()
+                    except Exception as close_error:
+                        self.logger.error(f"Error closing browser: {close_error}")
+                finally:
+                    prewarm.cancel()
+
+                await asyncio.sleep(interval)
         finally:
             await self.cleanup()
 
@@ -400,6 +916,10 @@ async def main():
     parser.add_argument("--ip", "-i", help="Target IP address (auto-detect if not provided)")
     parser.add_argument("--verbose", "-v", action="store_true",
                         help="Enable verbose logging")
+    parser.add_argument("--daemon", "-d", action="store_true",
+                        help="Keep running and update DNS whenever the IP changes")
+    parser.add_argument("--interval", "-n", type=int, default=TentenDDNSUpdater.DAEMON_INTERVAL,
+                        help="Seconds between IP checks in daemon mode")
 
     args = parser.parse_args()
 
@@ -409,6 +929,10 @@ async def main():
         if args.verbose:
             updater.logger.setLevel(logging.DEBUG)
 
+        if args.daemon:
+            await updater.run_daemon(args.interval, args.ip)
+            sys.exit(0)
+
         success = await updater.run(args.ip)
         sys.exit(0 if success else 1)
 